@@ -184,7 +184,12 @@ if __name__ == '__main__':
     
     try:
         import PIL
-        print("   ✅ PIL (Pillow)")
+        # Pillow-SIMD versions carry a ".postN" suffix (e.g. 9.5.0.post1)
+        if '.post' in PIL.__version__:
+            print(f"   ✅ PIL (Pillow-SIMD {PIL.__version__})")
+        else:
+            print(f"   ✅ PIL (Pillow {PIL.__version__})")
+            print("      ℹ️  Optional speedup: pip uninstall pillow && pip install pillow-simd")
     except ImportError:
         print("   ❌ Pillow - Run: pip install Pillow")
         dependencies_ok = False
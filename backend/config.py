@@ -91,6 +91,7 @@ class Defaults:
     TEMPERATURE_INPAINT = 0.5       # Slightly higher for creative inpainting
     
     # Image generation defaults
+    IMAGE_ENABLE_SEARCH = False     # Google Search grounding for image generation (extra round trip)
     IMAGE_TEMPERATURE = 0.4
     IMAGE_GUIDANCE_SCALE = 7.5
     IMAGE_NUM_STEPS = 40
@@ -206,6 +207,8 @@ class ImageConfig:
     MAX_IMAGE_SIZE = 2048  # Max dimension
     MIN_IMAGE_SIZE = 512   # Min dimension
     DEFAULT_QUALITY = 95   # JPEG quality
+    UPLOAD_JPEG_QUALITY = 90  # JPEG quality for images sent to Gemini
+    BASE64_CACHE_SIZE = 16  # Decoded base64 images kept per ImageProcessor (LRU)
     
     # Supported formats
     SUPPORTED_FORMATS = ['PNG', 'JPEG', 'JPG', 'WEBP']
@@ -223,6 +226,8 @@ class ImageConfig:
     # Edge detection
     EDGE_DETECTION_THRESHOLD_LOW = 50
     EDGE_DETECTION_THRESHOLD_HIGH = 150
+    EDGE_ENHANCE_MIN_DENSITY = 0.02  # Skip edge enhancement below this edge density
+    USE_OPENCL = False  # Run edge enhancement through cv2.UMat when an OpenCL device exists (not benchmarked yet)
     
     # Sketch detection
     SKETCH_DETAIL_THRESHOLD_LOW = 0.3
@@ -304,8 +309,29 @@ class PerformanceConfig:
     TRANSLATION_TIMEOUT = 30  # seconds
     
     # Caching
-    ENABLE_CACHE = False
+    ENABLE_CACHE = False  # Memoize generate_content_json results (off: every call samples fresh)
     CACHE_TTL = 3600  # 1 hour
+    JSON_CACHE_MAXSIZE = 128  # Memoized generate_content_json results (when ENABLE_CACHE)
+
+    # Gemini explicit context caching for long, repeated instruction prompts.
+    # Off: the current analysis/translation/planning prefixes are all below
+    # CONTEXT_CACHE_MIN_TOKENS, so enabling it only adds a count_tokens call
+    # per prefix. Turn on once a prompt prefix actually exceeds the minimum.
+    ENABLE_CONTEXT_CACHE = False
+    CONTEXT_CACHE_MIN_TOKENS = 1024  # Minimum cacheable size for Flash models
+    CONTEXT_CACHE_TTL = 3600  # seconds
+
+    # Gemini concurrency (AIMD limiter shared by all workers)
+    GEMINI_INITIAL_CONCURRENCY = 4
+    GEMINI_MIN_CONCURRENCY = 1
+    GEMINI_MAX_CONCURRENCY = 16
+
+    # Client-side requests-per-minute caps (sliding window, per model name)
+    # Empty = no client-side throttling. Quotas depend on the project's tier
+    # (see the rate-limit page in Google AI Studio) and this limiter counts
+    # per process: set each entry to your tier's RPM divided by the number of
+    # worker processes, e.g. {Models.FLASH_IMAGE: 10}
+    GEMINI_RPM_LIMITS: Dict[str, int] = {}
 
 # ============== PROMPTS ==============
 
@@ -5,13 +5,20 @@ Uses BOTH old (generativeai) and new (genai) APIs
 ✅ FIX: Hỗ trợ render ảnh 2K chuẩn xác
 """
 
+import asyncio
+import copy
+import hashlib
 import json
 import re
 import io
+import random
+import threading
 import time
 import urllib.request
 import urllib.error
-from typing import List, Optional, Union, Dict
+from collections import OrderedDict
+from datetime import timedelta
+from typing import List, Optional, Union, Dict, Tuple
 from PIL import Image
 
 from utils.logger import info, debug, warning, error
@@ -24,24 +31,86 @@ from google.generativeai import types as types_old
 try:
     from google import genai as genai_new
     from google.genai import types as types_new
+    from google.genai import errors as genai_errors
+    import httpx
     HAS_NEW_API = True
 except ImportError:
     HAS_NEW_API = False
     print("⚠️  google-genai not installed. Image generation will not work.")
 
+# Typed transient errors (OLD API raises google.api_core exceptions)
+try:
+    from google.api_core import exceptions as api_exceptions
+    _RETRYABLE_EXCEPTIONS = (
+        api_exceptions.ResourceExhausted,
+        api_exceptions.TooManyRequests,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.InternalServerError,
+        api_exceptions.DeadlineExceeded,
+        ConnectionError,
+        TimeoutError
+    )
+    HAS_API_CORE = True
+except ImportError:
+    HAS_API_CORE = False
+
+# HTTP status codes worth retrying for the NEW API (google.genai.errors.APIError)
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
 # Assumes config.py exists with these variables
-from config import GEMINI_API_KEY, Models, Defaults
+from config import GEMINI_API_KEY, Models, Defaults, PerformanceConfig, ImageConfig
+from .rate_limiter import AdaptiveConcurrencyLimiter, SlidingWindowRateLimiter
+
+# Formats Gemini returns for generated images (skips PIL's probe of every plugin)
+_IMAGE_FORMATS = ['PNG', 'JPEG', 'WEBP']
+
+# Markdown code fence around JSON responses: ```json ... ```
+_MD_FENCE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL | re.IGNORECASE)
 
 
 class GeminiClient:
     """Wrapper for Gemini API operations"""
 
-    def __init__(self, api_key: Optional[str] = None, max_retries: int = 3):
+    # ✅ Shared by all thread-local instances: one concurrency budget per process
+    _concurrency_limiter = AdaptiveConcurrencyLimiter(
+        initial=PerformanceConfig.GEMINI_INITIAL_CONCURRENCY,
+        min_limit=PerformanceConfig.GEMINI_MIN_CONCURRENCY,
+        max_limit=PerformanceConfig.GEMINI_MAX_CONCURRENCY
+    )
+    _rate_limiter = SlidingWindowRateLimiter(PerformanceConfig.GEMINI_RPM_LIMITS)
+
+    # ✅ Memoized generate_content_json results: key -> (timestamp, result)
+    _json_cache: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+    _json_cache_lock = threading.Lock()
+
+    # ✅ Server-side context caches: hash(model, prefix) -> (CachedContent, expire_ts),
+    # or None once the prefix is known to be below the minimum cacheable size
+    _cache_handles: Dict[str, Optional[Tuple[object, float]]] = {}
+    _cache_handles_lock = threading.Lock()
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        jitter: float = 0.5
+    ):
         """
         Initialize Gemini client
+
+        Args:
+            api_key: Gemini API key (defaults to GEMINI_API_KEY)
+            max_retries: Maximum attempts per API call
+            base_delay: Backoff base in seconds (doubled on each attempt)
+            max_delay: Upper bound for a single backoff sleep in seconds
+            jitter: Random extra fraction added to each backoff (0.5 = up to +50%)
         """
         self.api_key = api_key or GEMINI_API_KEY
         self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
 
         if not self.api_key:
             raise ValueError("Gemini API Key is missing. Please set GEMINI_API_KEY in .env")
@@ -51,42 +120,341 @@ class GeminiClient:
 
         # Configure NEW API (for images)
         if HAS_NEW_API:
-            self.client_new = genai_new.Client(api_key=self.api_key)
+            # Keep-alive pool for sync calls (no TLS handshake per request);
+            # force the httpx transport for client.aio (event-loop concurrency)
+            self.client_new = genai_new.Client(
+                api_key=self.api_key,
+                http_options=types_new.HttpOptions(
+                    client_args={
+                        "limits": httpx.Limits(max_keepalive_connections=20, max_connections=50)
+                    },
+                    async_client_args={"transport": httpx.AsyncHTTPTransport()}
+                )
+            )
         else:
             self.client_new = None
 
-    def _retry_with_backoff(self, func, *args, **kwargs):
+        # OLD API model objects, reused across calls (one per model name)
+        self._models: Dict[str, "genai_old.GenerativeModel"] = {}
+
+    def _get_model(self, model_name: str) -> "genai_old.GenerativeModel":
+        """Get the pinned OLD API model instance for `model_name`"""
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = genai_old.GenerativeModel(model_name)
+        return model
+
+    @staticmethod
+    def _parse_delay_seconds(value) -> Optional[float]:
+        """
+        Convert a server retry hint to seconds.
+        Accepts numbers, "13s"/"13" strings, timedelta and protobuf Duration.
+        """
+        if value is None:
+            return None
+        if isinstance(value, (int, float)):
+            return float(value)
+        if hasattr(value, 'total_seconds'):
+            return value.total_seconds()
+        if hasattr(value, 'seconds') and hasattr(value, 'nanos'):
+            return value.seconds + value.nanos / 1e9
+        try:
+            return float(str(value).strip().rstrip('s'))
+        except ValueError:
+            # HTTP-date form of Retry-After is not worth supporting here
+            return None
+
+    def _get_retry_delay(self, e: Exception) -> Optional[float]:
+        """
+        Extract the server-suggested retry delay from an API exception, if any
+        """
+        # google.api_core exceptions (old API)
+        delay = self._parse_delay_seconds(getattr(e, 'retry_delay', None))
+        if delay is not None:
+            return delay
+
+        details = getattr(e, 'details', None)
+        if isinstance(details, list):
+            # RetryInfo protobuf attached to api_core errors
+            for detail in details:
+                delay = self._parse_delay_seconds(getattr(detail, 'retry_delay', None))
+                if delay is not None:
+                    return delay
+        elif isinstance(details, dict):
+            # google-genai APIError keeps the JSON error body: {"error": {"details": [...]}}
+            error_body = details.get('error', details)
+            for detail in error_body.get('details', []) or []:
+                if isinstance(detail, dict) and 'retryDelay' in detail:
+                    delay = self._parse_delay_seconds(detail['retryDelay'])
+                    if delay is not None:
+                        return delay
+
+        # Plain HTTP Retry-After header
+        response = getattr(e, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if headers is not None:
+            return self._parse_delay_seconds(headers.get('retry-after'))
+
+        return None
+
+    @staticmethod
+    def _is_retryable(e: Exception) -> bool:
+        """
+        Classify an exception as transient (rate limit, 5xx, timeout, network)
+        """
+        if not HAS_API_CORE:
+            # Fallback: substring match on the message
+            error_msg = str(e).lower()
+            return any(x in error_msg for x in [
+                'rate limit', 'quota', 'timeout', 'connection',
+                'temporarily unavailable', '429', '500', '503'
+            ])
+
+        if isinstance(e, _RETRYABLE_EXCEPTIONS):
+            return True
+        if HAS_NEW_API:
+            if isinstance(e, genai_errors.APIError):
+                return e.code in _RETRYABLE_STATUS_CODES
+            if isinstance(e, httpx.TransportError):
+                return True
+        return False
+
+    def _backoff_time(self, e: Exception, attempt: int) -> float:
+        """
+        Seconds to wait before the next attempt: the server's retry hint if any,
+        otherwise jittered exponential backoff (so concurrent callers don't
+        retry in lockstep). Always clamped to max_delay.
+        """
+        backoff_time = self._get_retry_delay(e)
+        if backoff_time is None:
+            backoff_time = self.base_delay * (2 ** attempt) * (1 + random.uniform(0, self.jitter))
+        return min(self.max_delay, max(0.0, backoff_time))
+
+    def _retry_with_backoff(self, func, *args, rate_key: Optional[str] = None, **kwargs):
         """
         Execute function with exponential backoff retry logic
+
+        rate_key: Model name to charge against the RPM limiter before each attempt
         """
         last_exception = None
 
         for attempt in range(self.max_retries):
             try:
-                return func(*args, **kwargs)
+                # RPM wait first: never sleep on the window while holding a
+                # shared concurrency slot
+                if rate_key:
+                    self._rate_limiter.wait(rate_key)
+                # Hold a slot only for the call itself, never during backoff sleeps
+                with self._concurrency_limiter.slot():
+                    result = func(*args, **kwargs)
+                self._concurrency_limiter.on_success()
+                return result
             except Exception as e:
                 last_exception = e
-                error_msg = str(e).lower()
 
-                # Check if error is retryable
-                is_retryable = any(x in error_msg for x in [
-                    'rate limit', 'quota', 'timeout', 'connection',
-                    'temporarily unavailable', '429', '500', '503'
-                ])
+                # Pydantic validation errors are not retryable (handled by caller)
+                is_retryable = self._is_retryable(e)
 
-                # Check for Pydantic Validation Error (Not retryable via same method, but handled by caller)
-                if "validation error" in error_msg and "extra inputs" in error_msg:
-                    raise e 
+                if is_retryable:
+                    self._concurrency_limiter.on_throttle()
 
                 if not is_retryable or attempt == self.max_retries - 1:
                     raise e
 
-                backoff_time = 2 ** attempt
+                backoff_time = self._backoff_time(e, attempt)
                 warning(f"⚠️  Gemini API error (attempt {attempt + 1}/{self.max_retries}): {e}")
+                debug(f"   Retrying in {backoff_time:.1f}s")
                 time.sleep(backoff_time)
 
         raise last_exception
 
+    async def _aretry_with_backoff(self, afunc, *args, rate_key: Optional[str] = None, **kwargs):
+        """
+        Async variant of _retry_with_backoff: awaits `afunc` and sleeps with
+        asyncio.sleep so a throttled call never blocks the event loop
+        """
+        last_exception = None
+
+        for attempt in range(self.max_retries):
+            try:
+                if rate_key:
+                    await self._rate_limiter.await_slot(rate_key)
+                async with self._concurrency_limiter.aslot():
+                    result = await afunc(*args, **kwargs)
+                self._concurrency_limiter.on_success()
+                return result
+            except Exception as e:
+                last_exception = e
+
+                is_retryable = self._is_retryable(e)
+
+                if is_retryable:
+                    self._concurrency_limiter.on_throttle()
+
+                if not is_retryable or attempt == self.max_retries - 1:
+                    raise e
+
+                backoff_time = self._backoff_time(e, attempt)
+                warning(f"⚠️  Gemini API error (attempt {attempt + 1}/{self.max_retries}): {e}")
+                debug(f"   Retrying in {backoff_time:.1f}s")
+                await asyncio.sleep(backoff_time)
+
+        raise last_exception
+
+    @staticmethod
+    def _image_digest(img: Image.Image) -> str:
+        """
+        Hash image pixels once and remember the digest on the Image object
+        """
+        digest = getattr(img, '_s2r_digest', None)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(f"{img.mode}|{img.size}".encode('utf-8'))
+            h.update(img.tobytes())
+            digest = h.hexdigest()
+            img._s2r_digest = digest
+        return digest
+
+    def _json_cache_key(self, prompt_parts: Union[str, List], model_name: str, temperature: float) -> str:
+        """Stable hash of (model, temperature, prompt parts)"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{model_name}|{temperature}".encode('utf-8'))
+
+        parts = prompt_parts if isinstance(prompt_parts, list) else [prompt_parts]
+        for part in parts:
+            if isinstance(part, Image.Image):
+                h.update(b"|img:" + self._image_digest(part).encode('utf-8'))
+            elif isinstance(part, str):
+                h.update(b"|txt:" + part.encode('utf-8'))
+            else:
+                h.update(b"|obj:" + repr(part).encode('utf-8'))
+
+        return h.hexdigest()
+
+    def _json_cache_lookup(
+        self,
+        prompt_parts: Union[str, List],
+        model_name: str,
+        temperature: float
+    ) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        Look up a memoized JSON result
+
+        Returns:
+            (cache key, cached result); (None, None) when ENABLE_CACHE is off,
+            so nothing is hashed or stored
+        """
+        if not PerformanceConfig.ENABLE_CACHE:
+            return None, None
+        cache_key = self._json_cache_key(prompt_parts, model_name, temperature)
+        cached = self._json_cache_get(cache_key)
+        if cached is not None:
+            info(f"✅ JSON cache HIT (key: {cache_key[:8]}...)")
+        return cache_key, cached
+
+    def _json_cache_get(self, key: str) -> Optional[Dict]:
+        with self._json_cache_lock:
+            entry = self._json_cache.get(key)
+            if entry is None:
+                return None
+
+            timestamp, result = entry
+            if time.time() - timestamp > PerformanceConfig.CACHE_TTL:
+                del self._json_cache[key]
+                return None
+
+            self._json_cache.move_to_end(key)
+            return copy.deepcopy(result)
+
+    def _json_cache_set(self, key: str, result: Dict) -> None:
+        with self._json_cache_lock:
+            self._json_cache[key] = (time.time(), copy.deepcopy(result))
+            self._json_cache.move_to_end(key)
+            while len(self._json_cache) > PerformanceConfig.JSON_CACHE_MAXSIZE:
+                self._json_cache.popitem(last=False)
+
+    @staticmethod
+    def _split_prompt_parts(parts: List) -> Tuple[Optional[str], List]:
+        """
+        Split prompt parts into (stable instruction prefix, dynamic tail).
+        Only a leading text part followed by other parts counts as a prefix.
+        """
+        if len(parts) > 1 and isinstance(parts[0], str):
+            return parts[0], parts[1:]
+        return None, parts
+
+    def _get_cached_content(self, model_name: str, prefix: str):
+        """
+        Get (or lazily create) a server-side context cache for `prefix`.
+        Returns None when the prefix is too short or caching is unavailable.
+        """
+        key = hashlib.blake2b(f"{model_name}|{prefix}".encode('utf-8'), digest_size=16).hexdigest()
+        ttl = PerformanceConfig.CONTEXT_CACHE_TTL
+
+        with self._cache_handles_lock:
+            known = key in self._cache_handles
+            entry = self._cache_handles.get(key)
+
+        if known and entry is None:
+            # Previously found to be too short
+            return None
+
+        now = time.time()
+        if entry is not None:
+            handle, expire_ts = entry
+            if now < expire_ts - 60:
+                # Refresh TTL once half of it is used up
+                if expire_ts - now < ttl / 2:
+                    try:
+                        handle.update(ttl=timedelta(seconds=ttl))
+                        with self._cache_handles_lock:
+                            self._cache_handles[key] = (handle, now + ttl)
+                    except Exception as e:
+                        warning(f"⚠️  Context cache TTL refresh failed: {e}")
+                return handle
+
+        try:
+            token_count = self._get_model(model_name).count_tokens(prefix).total_tokens
+            if token_count < PerformanceConfig.CONTEXT_CACHE_MIN_TOKENS:
+                debug(f"   Prompt prefix too short for context cache ({token_count} tokens)")
+                handle_entry = None
+            else:
+                handle = genai_old.caching.CachedContent.create(
+                    model=model_name,
+                    contents=[prefix],
+                    ttl=timedelta(seconds=ttl)
+                )
+                info(f"💾 Created context cache for {model_name} ({token_count} tokens)")
+                handle_entry = (handle, now + ttl)
+        except Exception as e:
+            # Transient (429, network...): don't remember, try again next call
+            warning(f"⚠️  Context cache unavailable for {model_name}: {e}")
+            return None
+
+        with self._cache_handles_lock:
+            self._cache_handles[key] = handle_entry
+        return handle_entry[0] if handle_entry else None
+
+    @staticmethod
+    def _parse_json_text(text: Optional[str]) -> Dict:
+        """Parse a JSON response body, tolerating a Markdown code fence"""
+        if not text:
+            raise ValueError("Gemini returned empty response text")
+
+        response_text = text.strip()
+
+        # ✅ FIX: Robust Regex to clean Markdown Code Blocks
+        # Removes ```json at start and ``` at end
+        match = _MD_FENCE.search(response_text)
+        if match:
+            response_text = match.group(1)
+
+        try:
+            return json.loads(response_text)
+        except json.JSONDecodeError as e:
+            error(f"❌ JSON Parse Error. Raw text: {response_text[:100]}...")
+            raise ValueError(f"Invalid JSON from Gemini: {str(e)}")
+
     def generate_content_json(
         self,
         prompt_parts: Union[str, List],
@@ -97,9 +465,21 @@ class GeminiClient:
         Generate content and parse as JSON (uses OLD API)
         """
         def _generate():
-            model = genai_old.GenerativeModel(model_name)
             parts = prompt_parts if isinstance(prompt_parts, list) else [prompt_parts]
 
+            # ✅ Reuse a server-side cache for the instruction prefix when possible
+            cached_content = None
+            if PerformanceConfig.ENABLE_CONTEXT_CACHE:
+                prefix, tail = self._split_prompt_parts(parts)
+                if prefix is not None:
+                    cached_content = self._get_cached_content(model_name, prefix)
+
+            if cached_content is not None:
+                model = genai_old.GenerativeModel.from_cached_content(cached_content)
+                parts = tail
+            else:
+                model = self._get_model(model_name)
+
             response = model.generate_content(
                 parts,
                 generation_config=types_old.GenerationConfig(
@@ -108,25 +488,163 @@ class GeminiClient:
                 )
             )
             
-            if not response.text:
-                raise ValueError("Gemini returned empty response text")
+            return self._parse_json_text(response.text)
 
-            response_text = response.text.strip()
-            
-            # ✅ FIX: Robust Regex to clean Markdown Code Blocks
-            # Removes ```json at start and ``` at end
-            pattern = r"^```(?:json)?\s*(.*?)\s*```$"
-            match = re.search(pattern, response_text, re.DOTALL | re.IGNORECASE)
-            if match:
-                response_text = match.group(1)
+        cache_key, cached = self._json_cache_lookup(prompt_parts, model_name, temperature)
+        if cached is not None:
+            return cached
 
-            try:
-                return json.loads(response_text)
-            except json.JSONDecodeError as e:
-                error(f"❌ JSON Parse Error. Raw text: {response_text[:100]}...")
-                raise ValueError(f"Invalid JSON from Gemini: {str(e)}")
+        result = self._retry_with_backoff(_generate, rate_key=model_name)
+        if cache_key is not None:
+            self._json_cache_set(cache_key, result)
+        return result
 
-        return self._retry_with_backoff(_generate)
+    async def agenerate_content_json(
+        self,
+        prompt_parts: Union[str, List],
+        model_name: str = Models.FLASH,
+        temperature: float = Defaults.TEMPERATURE_ANALYSIS
+    ) -> Dict:
+        """
+        Async variant of generate_content_json (uses NEW API client.aio).
+        Shares the memoization cache with the sync method; context caching
+        is only available on the OLD API path.
+        """
+        if not HAS_NEW_API or not self.client_new:
+            raise ImportError("Library 'google-genai' not installed. Add to requirements.txt")
+
+        cache_key, cached = self._json_cache_lookup(prompt_parts, model_name, temperature)
+        if cached is not None:
+            return cached
+
+        async def _agenerate():
+            parts = prompt_parts if isinstance(prompt_parts, list) else [prompt_parts]
+
+            response = await self.client_new.aio.models.generate_content(
+                model=model_name,
+                contents=parts,
+                config={
+                    "temperature": temperature,
+                    "response_mime_type": "application/json"
+                }
+            )
+            return self._parse_json_text(response.text)
+
+        result = await self._aretry_with_backoff(_agenerate, rate_key=model_name)
+        if cache_key is not None:
+            self._json_cache_set(cache_key, result)
+        return result
+
+    @staticmethod
+    def _resolve_upload_format(img: Image.Image, upload_format: str = 'auto') -> str:
+        """
+        Pick 'png' or 'jpeg' for an upload.
+        'auto' keeps PNG for masks, palette/grayscale and alpha images; JPEG otherwise.
+        """
+        if upload_format != 'auto':
+            fmt = upload_format.lower()
+            return 'jpeg' if fmt == 'jpg' else fmt
+        if img.mode not in ('RGB', 'CMYK', 'YCbCr'):
+            return 'png'
+        # Binary masks saved as RGB (≤2 unique colors)
+        if img.getcolors(2) is not None:
+            return 'png'
+        return 'jpeg'
+
+    @staticmethod
+    def _encode_for_upload(img: Image.Image, upload_format: str = 'auto') -> Tuple[bytes, str]:
+        """
+        Encode image for upload once and remember the bytes on the Image object,
+        so retries and the REST fallback don't re-encode the same image.
+
+        Returns:
+            (encoded bytes, mime type)
+        """
+        fmt = GeminiClient._resolve_upload_format(img, upload_format)
+
+        upload_cache = getattr(img, '_s2r_upload_cache', None)
+        if upload_cache is None:
+            upload_cache = img._s2r_upload_cache = {}
+
+        if fmt not in upload_cache:
+            buf = io.BytesIO()
+            if fmt == 'jpeg':
+                img.save(buf, format='JPEG', quality=ImageConfig.UPLOAD_JPEG_QUALITY, optimize=False)
+            else:
+                # compress_level=1: slightly larger upload for much faster zlib
+                img.save(buf, format='PNG', optimize=False, compress_level=1)
+            upload_cache[fmt] = buf.getvalue()
+
+        return upload_cache[fmt], f"image/{fmt}"
+
+    def _build_image_contents(
+        self,
+        prompt: str,
+        source_image: Optional[Image.Image],
+        reference_image: Optional[Image.Image],
+        upload_format: str = 'auto'
+    ) -> List:
+        """Build NEW API contents: [source image] + [reference image] + prompt"""
+        parts = []
+
+        for img in (source_image, reference_image):
+            if img:
+                data, mime_type = self._encode_for_upload(img, upload_format)
+                parts.append(types_new.Part.from_bytes(data=data, mime_type=mime_type))
+
+        parts.append(types_new.Part.from_text(text=prompt))
+        return [types_new.Content(role="user", parts=parts)]
+
+    def _image_generation_config(self, temperature: float, enable_search: bool = False) -> Dict:
+        """Config dictionary cho SDK (2K image output)"""
+        config = {
+            "response_modalities": ["IMAGE", "TEXT"],
+            "temperature": temperature,
+            "image_config": {
+                "image_size": "2K"
+            }
+        }
+        if enable_search:
+            config["tools"] = [{"googleSearch": {}}]
+        return config
+
+    def _collect_chunk(self, chunk, image_buf: bytearray, text_metadata: List[str]) -> None:
+        """
+        Append a stream chunk's image bytes to `image_buf` (collecting any text parts).
+        Interim "thought" images are skipped; only final image data is kept.
+        """
+        if chunk.candidates:
+            candidate = chunk.candidates[0]
+            if candidate.content and candidate.content.parts:
+                for part in candidate.content.parts:
+                    if hasattr(part, 'text') and part.text:
+                        text_metadata.append(part.text)
+                    if part.inline_data and part.inline_data.data and not getattr(part, 'thought', False):
+                        image_buf.extend(part.inline_data.data)
+
+    @staticmethod
+    def _decode_image(data: Union[bytes, bytearray]) -> Image.Image:
+        """Decode generated image bytes once, fully"""
+        generated_image = Image.open(io.BytesIO(data), formats=_IMAGE_FORMATS)
+        generated_image.load()
+        return generated_image
+
+    @staticmethod
+    def _is_sdk_validation_error(e: Exception) -> bool:
+        """Bắt lỗi "Extra inputs forbidden" hoặc lỗi Validation liên quan đến image_size"""
+        error_str = str(e).lower()
+        return ("validation error" in error_str and "extra" in error_str) or ("image_size" in error_str)
+
+    def _use_rest_fallback(self, e: Exception) -> bool:
+        """
+        Decide (and log) whether a failed SDK image call should be retried
+        through the Raw REST API (local SDK validation rejected the 2K config)
+        """
+        if not self._is_sdk_validation_error(e):
+            return False
+        warning("⚠️  Local SDK Validation Failed (likely old version).")
+        print("🔄 Switching to Raw REST API Fallback to force 2K render...")
+        return True
 
     def generate_image(
         self,
@@ -134,11 +652,16 @@ class GeminiClient:
         source_image: Optional[Image.Image] = None,
         reference_image: Optional[Image.Image] = None,
         model_name: str = Models.FLASH_IMAGE,
-        temperature: float = Defaults.TEMPERATURE_GENERATION
+        temperature: float = Defaults.TEMPERATURE_GENERATION,
+        upload_format: str = 'auto',
+        enable_search: bool = Defaults.IMAGE_ENABLE_SEARCH
     ) -> Image.Image:
         """
         Generate image using NEW API (google-genai).
         Falls back to Raw REST API if local library validation fails (e.g. 2K issue).
+
+        upload_format: 'auto' (JPEG q=90 for photos, PNG for masks/alpha), 'png' or 'jpeg'
+        enable_search: Attach the Google Search tool (only when the prompt needs real-world context)
         """
         if not HAS_NEW_API:
             raise ImportError("Library 'google-genai' not installed. Add to requirements.txt")
@@ -149,61 +672,82 @@ class GeminiClient:
         # 1. Định nghĩa hàm gọi SDK chuẩn
         def _generate_img_sdk():
             print(f"🎨 Generating image with {model_name} (SDK Mode)...")
-            parts = []
-            
-            if source_image:
-                img_byte_arr = io.BytesIO()
-                source_image.save(img_byte_arr, format='PNG')
-                parts.append(types_new.Part.from_bytes(data=img_byte_arr.getvalue(), mime_type="image/png"))
-            
-            if reference_image:
-                img_byte_arr = io.BytesIO()
-                reference_image.save(img_byte_arr, format='PNG')
-                parts.append(types_new.Part.from_bytes(data=img_byte_arr.getvalue(), mime_type="image/png"))
-            
-            parts.append(types_new.Part.from_text(text=prompt))
-            contents = [types_new.Content(role="user", parts=parts)]
+            contents = self._build_image_contents(prompt, source_image, reference_image, upload_format)
 
-            # Config dictionary cho SDK
-            generate_content_config = {
-                "response_modalities": ["IMAGE", "TEXT"],
-                "temperature": temperature,
-                "image_config": {
-                    "image_size": "2K"
-                },
-                "tools": [{"googleSearch": {}}]
-            }
-            
             text_metadata = []
+            image_buf = bytearray()
             for chunk in self.client_new.models.generate_content_stream(
                 model=model_name,
                 contents=contents,
-                config=generate_content_config 
+                config=self._image_generation_config(temperature, enable_search)
             ):
-                if chunk.candidates:
-                    candidate = chunk.candidates[0]
-                    if candidate.content and candidate.content.parts:
-                        for part in candidate.content.parts:
-                            if hasattr(part, 'text') and part.text:
-                                text_metadata.append(part.text)
-                            if part.inline_data and part.inline_data.data:
-                                print(f"   ✅ Image received (SDK)!")
-                                return Image.open(io.BytesIO(part.inline_data.data))
-
-            raise RuntimeError("Gemini API returned no image.")
+                self._collect_chunk(chunk, image_buf, text_metadata)
+
+            if not image_buf:
+                raise RuntimeError("Gemini API returned no image.")
+
+            print(f"   ✅ Image received (SDK)!")
+            return self._decode_image(image_buf)
 
         # 2. Thử gọi SDK, nếu lỗi Validation -> Gọi Fallback
         try:
-            return self._retry_with_backoff(_generate_img_sdk)
+            return self._retry_with_backoff(_generate_img_sdk, rate_key=model_name)
         except Exception as e:
-            error_str = str(e).lower()
-            # Bắt lỗi "Extra inputs forbidden" hoặc lỗi Validation liên quan đến image_size
-            if ("validation error" in error_str and "extra" in error_str) or ("image_size" in error_str):
-                warning(f"⚠️  Local SDK Validation Failed (likely old version).")
-                print(f"🔄 Switching to Raw REST API Fallback to force 2K render...")
-                return self._generate_image_raw_rest(prompt, source_image, reference_image, model_name, temperature)
-            else:
-                raise e
+            if not self._use_rest_fallback(e):
+                raise
+            return self._generate_image_raw_rest(
+                prompt, source_image, reference_image, model_name, temperature, upload_format, enable_search
+            )
+
+    async def agenerate_image(
+        self,
+        prompt: str,
+        source_image: Optional[Image.Image] = None,
+        reference_image: Optional[Image.Image] = None,
+        model_name: str = Models.FLASH_IMAGE,
+        temperature: float = Defaults.TEMPERATURE_GENERATION,
+        upload_format: str = 'auto',
+        enable_search: bool = Defaults.IMAGE_ENABLE_SEARCH
+    ) -> Image.Image:
+        """
+        Async variant of generate_image using the NEW API's client.aio.
+        Runs on the event loop instead of occupying a worker thread per request.
+        """
+        if not HAS_NEW_API:
+            raise ImportError("Library 'google-genai' not installed. Add to requirements.txt")
+
+        if not self.client_new:
+            raise ValueError("Gemini Client (New API) not initialized.")
+
+        async def _agenerate_img_sdk():
+            print(f"🎨 Generating image with {model_name} (Async SDK Mode)...")
+            contents = self._build_image_contents(prompt, source_image, reference_image, upload_format)
+
+            text_metadata = []
+            image_buf = bytearray()
+            stream = await self.client_new.aio.models.generate_content_stream(
+                model=model_name,
+                contents=contents,
+                config=self._image_generation_config(temperature, enable_search)
+            )
+            async for chunk in stream:
+                self._collect_chunk(chunk, image_buf, text_metadata)
+
+            if not image_buf:
+                raise RuntimeError("Gemini API returned no image.")
+
+            print("   ✅ Image received (Async SDK)!")
+            return self._decode_image(image_buf)
+
+        try:
+            return await self._aretry_with_backoff(_agenerate_img_sdk, rate_key=model_name)
+        except Exception as e:
+            if not self._use_rest_fallback(e):
+                raise
+            return await asyncio.to_thread(
+                self._generate_image_raw_rest,
+                prompt, source_image, reference_image, model_name, temperature, upload_format, enable_search
+            )
 
     def _generate_image_raw_rest(
         self,
@@ -211,7 +755,9 @@ class GeminiClient:
         source_image: Optional[Image.Image],
         reference_image: Optional[Image.Image],
         model_name: str,
-        temperature: float
+        temperature: float,
+        upload_format: str = 'auto',
+        enable_search: bool = False
     ) -> Image.Image:
         """
         Fallback method: Manually constructs HTTP request to bypass strict SDK validation.
@@ -224,15 +770,13 @@ class GeminiClient:
         
         # Helper to convert image to base64 part
         def img_to_part(img):
-            buf = io.BytesIO()
-            img.save(buf, format='PNG')
-            b64_data = io.BytesIO(buf.getvalue()).read()
+            data, mime_type = self._encode_for_upload(img, upload_format)
             # Standard base64 encoding for JSON payload
             import base64
             return {
                 "inlineData": {
-                    "mimeType": "image/png",
-                    "data": base64.b64encode(b64_data).decode('utf-8')
+                    "mimeType": mime_type,
+                    "data": base64.b64encode(data).decode('utf-8')
                 }
             }
 
@@ -257,12 +801,14 @@ class GeminiClient:
                     "imageSize": "2K"
                 }
                 # ❌ tools KHÔNG được nằm ở đây trong REST API
-            },
-            "tools": [{"googleSearch": {}}] # ✅ tools phải nằm ở root level
+            }
         }
+        if enable_search:
+            payload["tools"] = [{"googleSearch": {}}]  # ✅ tools phải nằm ở root level
 
         # Send Request
         try:
+            self._rate_limiter.wait(model_name)
             req = urllib.request.Request(
                 url,
                 data=json.dumps(payload).encode('utf-8'),
@@ -287,7 +833,7 @@ class GeminiClient:
                     import base64
                     img_data = base64.b64decode(b64_resp)
                     print(f"   ✅ Image received (Raw REST Fallback) - 2K Success!")
-                    return Image.open(io.BytesIO(img_data))
+                    return self._decode_image(img_data)
                 
                 if 'text' in part:
                     print(f"   📝 Metadata: {part['text'][:50]}...")
@@ -320,5 +866,6 @@ class GeminiClient:
             prompt=inpaint_prompt,
             source_image=original,
             reference_image=mask,
-            model_name=Models.FLASH_IMAGE 
+            model_name=Models.FLASH_IMAGE,
+            enable_search=False  # Inpainting never needs web context
         )
\ No newline at end of file
@@ -3,16 +3,29 @@ core/image_processor.py - Image Processing with CV2
 """
 
 import base64
+import hashlib
 import io
-import re
-from typing import Optional, Tuple
-from dataclasses import dataclass
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+from dataclasses import dataclass, field
 
 import cv2
 import numpy as np
 from PIL import Image
 
 from config import SUPPORTED_ASPECT_RATIOS, ImageConfig
+from .thread_local import get_image_processor
+
+# PIL modes without color information (is_colored=False)
+_GRAYSCALE_MODES = frozenset({'1', 'L', 'LA', 'I', 'I;16', 'F'})
+
+# Probed once per process: haveOpenCL() may initialize the OpenCL runtime
+_HAS_OPENCL = ImageConfig.USE_OPENCL and cv2.ocl.haveOpenCL()
 
 
 @dataclass
@@ -23,29 +36,135 @@ class SketchInfo:
     is_colored: bool
     mean_intensity: float
     edge_density: float
+    # Full-resolution grayscale from detection, reused by preprocess_sketch
+    gray: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+
+
+def _image_to_payload(pil_image: Image.Image) -> Tuple[str, Tuple[int, int], bytes]:
+    """Serialize raw pixels for crossing a process boundary (no PIL pickling)"""
+    if pil_image.mode not in ('1', 'L', 'LA', 'RGB', 'RGBA'):
+        pil_image = pil_image.convert('RGBA' if 'A' in pil_image.getbands() else 'RGB')
+    return pil_image.mode, pil_image.size, pil_image.tobytes()
+
+
+def _payload_to_image(payload: Tuple[str, Tuple[int, int], bytes]) -> Image.Image:
+    mode, size, data = payload
+    return Image.frombytes(mode, size, data)
+
+
+def _init_batch_worker():
+    """Worker processes already run in parallel: keep OpenCV single-threaded"""
+    cv2.setNumThreads(1)
+
+
+def _detect_and_preprocess(
+    processor: "ImageProcessor",
+    pil_image: Image.Image,
+    target_aspect_ratio: str,
+    preserve_quality: bool
+) -> Image.Image:
+    """Detect + preprocess one sketch with the given processor"""
+    sketch_info = processor.detect_sketch_type(pil_image)
+    return processor.preprocess_sketch(
+        pil_image,
+        target_aspect_ratio=target_aspect_ratio,
+        sketch_info=sketch_info,
+        preserve_quality=preserve_quality
+    )
+
+
+def _batch_preprocess_worker(args) -> Tuple[str, Tuple[int, int], bytes]:
+    """Detect + preprocess one sketch inside a worker process"""
+    payload, target_aspect_ratio, preserve_quality = args
+    result = _detect_and_preprocess(
+        get_image_processor(), _payload_to_image(payload), target_aspect_ratio, preserve_quality
+    )
+    return _image_to_payload(result)
+
+
+# ✅ Batch pools: one of each per server process, created on first use and reused.
+# 'spawn': never fork the multi-threaded Flask process (gRPC state, held locks)
+_process_pool: Optional[ProcessPoolExecutor] = None
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Get the shared batch-preprocessing process pool"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_batch_worker
+            )
+        return _process_pool
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool (worker died: OOM, native crash) so the next batch gets a fresh one"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    """Get the shared batch-preprocessing thread pool"""
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                thread_name_prefix='sketch-batch'
+            )
+        return _thread_pool
 
 
 class ImageProcessor:
     """Handle all image processing operations"""
     
+    def __init__(self):
+        # ✅ LRU of decoded images: the frontend often re-sends the same sketch
+        self._b64_cache: OrderedDict[str, Tuple[Image.Image, str]] = OrderedDict()
+        # ✅ Built once: CLAHE setup allocates tile LUTs/buffers on every create
+        # (safe to share since ImageProcessor instances are thread-local)
+        self._clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        # ✅ T-API: keep the enhance chain on the OpenCL device when there is one
+        self._use_opencl = _HAS_OPENCL
+    
     def process_base64_image(self, base64_string: str) -> Tuple[Optional[Image.Image], Optional[str]]:
         """
         Convert base64 string to PIL Image
         """
         try:
+            # Inside the try: None / non-str input must still return (None, None)
+            cache_key = hashlib.blake2b(base64_string.encode('ascii', 'ignore'), digest_size=16).hexdigest()
+            cached = self._b64_cache.get(cache_key)
+            if cached is not None:
+                self._b64_cache.move_to_end(cache_key)
+                return cached
+            
             if base64_string.startswith('data:'):
-                match = re.match(r'data:([^;]+);base64,(.+)', base64_string)
-                if match:
-                    mime_type = match.group(1)
-                    base64_data = match.group(2)
-                else:
+                # Split off the short header instead of running a regex over the payload
+                header, _, base64_data = base64_string.partition(',')
+                mime_type, _, encoding = header[5:].partition(';')
+                if not mime_type or encoding != 'base64' or not base64_data:
                     return None, None
             else:
                 base64_data = base64_string
                 mime_type = 'image/jpeg'
             
-            image_bytes = base64.b64decode(base64_data)
+            image_bytes = base64.b64decode(base64_data, validate=False)
             pil_image = Image.open(io.BytesIO(image_bytes))
+            # Decode once now instead of lazily somewhere mid-pipeline
+            pil_image.load()
+            
+            self._b64_cache[cache_key] = (pil_image, mime_type)
+            if len(self._b64_cache) > ImageConfig.BASE64_CACHE_SIZE:
+                self._b64_cache.popitem(last=False)
             
             return pil_image, mime_type
             
@@ -53,26 +172,81 @@ class ImageProcessor:
             print(f"Error processing base64 image: {e}")
             return None, None
     
+    @staticmethod
+    def _sketch_stats(gray: np.ndarray) -> Tuple[float, float]:
+        """
+        Compute (mean intensity, Canny edge density) of a grayscale image
+        using OpenCV's SIMD reductions
+        
+        Runs at full resolution: edge density is not scale-invariant (a
+        downsampled image packs the same lines into fewer pixels), and the
+        detail_level / EDGE_ENHANCE_MIN_DENSITY thresholds are calibrated on
+        the original size.
+        """
+        # cv2.mean / countNonZero: single SIMD pass, no float64 or bool temporaries
+        mean_intensity = cv2.mean(gray)[0]
+        
+        edges = cv2.Canny(gray, 
+                          ImageConfig.EDGE_DETECTION_THRESHOLD_LOW, 
+                          ImageConfig.EDGE_DETECTION_THRESHOLD_HIGH,
+                          apertureSize=3,
+                          L2gradient=False)
+        edge_density = cv2.countNonZero(edges) / edges.size
+        
+        return mean_intensity, edge_density
+    
+    @staticmethod
+    def _to_gray8(pil_image: Image.Image) -> np.ndarray:
+        """8-bit grayscale array of `pil_image`, scaling high bit-depth modes"""
+        mode = pil_image.mode
+        if mode in ('I', 'I;16'):
+            # 16-bit data (16-bit PNGs open as 'I'): keep the high byte,
+            # like cv2.imdecode(IMREAD_GRAYSCALE) does. convert('L') would clip.
+            return (np.clip(np.asarray(pil_image), 0, 65535) >> 8).astype(np.uint8)
+        if mode == 'F':
+            # No fixed range for float images: stretch to 0..255
+            return cv2.normalize(np.asarray(pil_image), None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+        
+        # convert('L') uses the same ITU-R 601 weights as COLOR_RGB2GRAY.
+        # np.asarray still copies (Pillow exports via tobytes()), but only
+        # one single-channel buffer instead of H x W x 3
+        return np.asarray(pil_image if mode == 'L' else pil_image.convert('L'))
+    
     def detect_sketch_type(self, pil_image: Image.Image) -> SketchInfo:
         """
         Detect sketch characteristics
         """
-        img_array = np.array(pil_image)
+        # The mode already tells us the channel layout: no RGB array needed
+        is_colored = pil_image.mode not in _GRAYSCALE_MODES
         
-        if len(img_array.shape) == 3:
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            is_colored = True
-        else:
-            gray = img_array
-            is_colored = False
+        gray = self._to_gray8(pil_image)
         
-        mean_intensity = np.mean(gray)
+        mean_intensity, edge_density = self._sketch_stats(gray)
+        sketch_info = self._classify_sketch(mean_intensity, edge_density, is_colored)
+        sketch_info.gray = gray
+        return sketch_info
+    
+    def detect_sketch_type_from_bytes(self, image_bytes: bytes) -> SketchInfo:
+        """
+        Detect sketch characteristics straight from encoded image bytes.
+        OpenCV decodes directly into a grayscale buffer, so no full RGB
+        decode or RGB→GRAY pass is needed.
+        """
+        # Header-only parse (lazy) for the mode
+        header = Image.open(io.BytesIO(image_bytes))
+        is_colored = header.mode not in _GRAYSCALE_MODES
         
-        edges = cv2.Canny(gray, 
-                          ImageConfig.EDGE_DETECTION_THRESHOLD_LOW, 
-                          ImageConfig.EDGE_DETECTION_THRESHOLD_HIGH)
-        edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
+        # Full size: the edge-density thresholds assume original resolution
+        gray = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("Could not decode image bytes")
         
+        mean_intensity, edge_density = self._sketch_stats(gray)
+        return self._classify_sketch(mean_intensity, edge_density, is_colored)
+    
+    @staticmethod
+    def _classify_sketch(mean_intensity: float, edge_density: float, is_colored: bool) -> SketchInfo:
+        """Bucket sketch statistics into a SketchInfo"""
         if mean_intensity > 200:
             sketch_type = 'line_drawing'
         elif mean_intensity > 150:
@@ -91,8 +265,8 @@ class ImageProcessor:
             sketch_type=sketch_type,
             detail_level=detail_level,
             is_colored=is_colored,
-            mean_intensity=float(mean_intensity),
-            edge_density=float(edge_density)
+            mean_intensity=mean_intensity,
+            edge_density=edge_density
         )
     
     def preprocess_sketch(
@@ -134,47 +308,161 @@ class ImageProcessor:
                 return pil_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
 
         # Fallback to standard resize logic if preserve_quality=False or legacy mode
-        img_array = np.array(pil_image)
-        h, w = img_array.shape[:2]
+        gray = sketch_info.gray if sketch_info else None
+        if pil_image.mode not in ('L', 'RGB', 'RGBA'):
+            pil_image = pil_image.convert('RGB')
+
+        w, h = pil_image.size
         scale = min(target_w / w, target_h / h)
         new_w, new_h = int(w * scale), int(h * scale)
+        same_size = (new_w, new_h) == (w, h)
+        y_offset = (target_h - new_h) // 2
+        x_offset = (target_w - new_w) // 2
 
-        if len(img_array.shape) == 3:
-            resized = cv2.resize(img_array, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
-        else:
-            resized = cv2.resize(img_array, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
+        # Nearly blank sketches have no lines worth enhancing: skip the filter chain
+        needs_enhance = bool(
+            not preserve_quality and sketch_info and sketch_info.sketch_type == 'line_drawing'
+            and sketch_info.edge_density >= ImageConfig.EDGE_ENHANCE_MIN_DENSITY
+        )
 
-        if not preserve_quality and sketch_info and sketch_info.sketch_type == 'line_drawing':
-            resized = self._enhance_edges(resized)
+        if not needs_enhance:
+            # Stay in PIL (SIMD kernels with Pillow-SIMD): no numpy round-trip
+            # Warm path: already at the fitted size, no resample needed
+            resized = pil_image if same_size else pil_image.resize((new_w, new_h), Image.Resampling.BICUBIC)
+            if (new_w, new_h) == (target_w, target_h):
+                # Aspect ratio already matches: nothing to pad
+                return resized
+            bands = len(resized.getbands())
+            canvas = Image.new(resized.mode, (target_w, target_h), 255 if bands == 1 else (255,) * bands)
+            canvas.paste(resized, (x_offset, y_offset))
+            return canvas
+
+        # INTER_AREA (downscale) / INTER_CUBIC (upscale) both have SIMD kernels;
+        # OpenCV's LANCZOS4 runs scalar
+        interp = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
 
-        if len(resized.shape) == 3:
-            padded = np.ones((target_h, target_w, resized.shape[2]), dtype=np.uint8) * 255
+        if gray is not None and gray.shape[:2] == (h, w):
+            # Enhancement only looks at luminance: resize the grayscale from
+            # detection instead of resizing RGB and converting it again
+            resized = gray if same_size else cv2.resize(gray, (new_w, new_h), interpolation=interp)
+            resized = self._enhance_edges(resized, to_rgb=pil_image.mode != 'L')
         else:
-            padded = np.ones((target_h, target_w), dtype=np.uint8) * 255
+            resized = np.asarray(pil_image)
+            if not same_size:
+                resized = cv2.resize(resized, (new_w, new_h), interpolation=interp)
+            resized = self._enhance_edges(resized)
 
-        y_offset = (target_h - new_h) // 2
-        x_offset = (target_w - new_w) // 2
-        padded[y_offset:y_offset+new_h, x_offset:x_offset+new_w] = resized
+        if (new_w, new_h) == (target_w, target_h):
+            return Image.fromarray(resized)
+
+        # Pad to target with white in one pass (no full-canvas allocate + multiply)
+        white = (255,) * resized.shape[2] if len(resized.shape) == 3 else 255
+        padded = cv2.copyMakeBorder(
+            resized,
+            y_offset, target_h - new_h - y_offset,
+            x_offset, target_w - new_w - x_offset,
+            cv2.BORDER_CONSTANT, value=white
+        )
 
         return Image.fromarray(padded)
     
-    def _enhance_edges(self, img_array: np.ndarray) -> np.ndarray:
-        """Gently enhance edges for line drawings"""
-        if len(img_array.shape) == 3:
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        else:
-            gray = img_array
+    def _run_batch(
+        self,
+        sketches: List[Image.Image],
+        target_aspect_ratio: str,
+        preserve_quality: bool,
+        use_processes: bool
+    ) -> List[Image.Image]:
+        """
+        Detect + preprocess several sketches on a shared worker pool
+        
+        Args:
+            sketches: Input sketches
+            target_aspect_ratio: Passed to preprocess_sketch
+            preserve_quality: Passed to preprocess_sketch
+            use_processes: Process pool (pixels copied across) instead of thread pool
+        
+        Returns:
+            Preprocessed images, in input order
+        """
+        if len(sketches) <= 1:
+            # Not worth a pool round-trip for a single image
+            return [_detect_and_preprocess(self, s, target_aspect_ratio, preserve_quality) for s in sketches]
+        
+        if use_processes:
+            jobs = [(_image_to_payload(s), target_aspect_ratio, preserve_quality) for s in sketches]
+            pool = _get_process_pool()
+            try:
+                results = list(pool.map(_batch_preprocess_worker, jobs))
+            except BrokenProcessPool:
+                _discard_process_pool(pool)
+                raise
+            return [_payload_to_image(payload) for payload in results]
+        
+        # Each pool thread uses its own thread-local ImageProcessor
+        # (the cached CLAHE object is not thread-safe)
+        return list(_get_thread_pool().map(
+            lambda s: _detect_and_preprocess(get_image_processor(), s, target_aspect_ratio, preserve_quality),
+            sketches
+        ))
+    
+    def batch_preprocess(
+        self,
+        sketches: List[Image.Image],
+        target_aspect_ratio: str = "16:9",
+        preserve_quality: bool = True
+    ) -> List[Image.Image]:
+        """Detect + preprocess several sketches in parallel worker processes"""
+        return self._run_batch(sketches, target_aspect_ratio, preserve_quality, use_processes=True)
+    
+    def process_batch(
+        self,
+        sketches: List[Image.Image],
+        target_aspect_ratio: str = "16:9",
+        preserve_quality: bool = True
+    ) -> List[Image.Image]:
+        """
+        Detect + preprocess several sketches on a thread pool.
+        OpenCV and Pillow release the GIL inside their kernels, so threads
+        parallelize across images without copying pixels between processes.
+        """
+        return self._run_batch(sketches, target_aspect_ratio, preserve_quality, use_processes=False)
+    
+    def _enhance_edges(self, img_array: np.ndarray, to_rgb: Optional[bool] = None) -> np.ndarray:
+        """
+        Gently enhance edges for line drawings
+        
+        Args:
+            img_array: RGB or grayscale image
+            to_rgb: Return RGB (default: same layout as the input). Pass True
+                    with a grayscale input to skip the RGB→GRAY conversion.
+        """
+        is_rgb = img_array.ndim == 3
+        if to_rgb is None:
+            to_rgb = is_rgb
+        
+        if self._use_opencl:
+            try:
+                # Same chain on UMat: buffers stay on the device between kernels
+                return self._enhance_edges_impl(cv2.UMat(img_array), is_rgb, to_rgb).get()
+            except cv2.error as e:
+                print(f"   ⚠️  OpenCL edge enhancement failed, using CPU: {e}")
+                self._use_opencl = False
 
-        filtered = cv2.bilateralFilter(gray, 5, 50, 50)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(filtered)
+        return self._enhance_edges_impl(img_array, is_rgb, to_rgb)
 
-        kernel = np.array([[-0.5, -0.5, -0.5],
-                          [-0.5,  5.0, -0.5],
-                          [-0.5, -0.5, -0.5]])
-        sharpened = cv2.filter2D(enhanced, -1, kernel)
+    def _enhance_edges_impl(self, img, is_rgb: bool, to_rgb: bool):
+        """bilateral → CLAHE → sharpen; accepts np.ndarray or cv2.UMat"""
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY) if is_rgb else img
 
-        if len(img_array.shape) == 3:
+        filtered = cv2.bilateralFilter(gray, 5, 50, 50)
+        enhanced = self._clahe.apply(filtered)
+        # Unsharp mask equal to the old [-0.5 .. 5.0 .. -0.5] 3x3 kernel:
+        # 5*x - 0.5*(9*mean3x3 - x) = 5.5*x - 4.5*mean3x3, all in uint8 SIMD
+        blurred = cv2.blur(enhanced, (3, 3))
+        sharpened = cv2.addWeighted(enhanced, 5.5, blurred, -4.5, 0)
+
+        if to_rgb:
             sharpened = cv2.cvtColor(sharpened, cv2.COLOR_GRAY2RGB)
 
         return sharpened
@@ -184,21 +472,47 @@ class ImageProcessor:
         Resize image, default max_size boosted to 2048 for better analysis
         """
         w, h = pil_image.size
+        long_edge = max(w, h)
         
-        if w <= max_size and h <= max_size:
+        if long_edge <= max_size:
             return pil_image
         
-        if w > h:
-            new_w = max_size
-            new_h = int(h * (max_size / w))
-        else:
-            new_h = max_size
-            new_w = int(w * (max_size / h))
+        # One scale for both axes; the long edge lands exactly on max_size
+        scale = max_size / long_edge
+        new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
         
-        return pil_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        # BICUBIC: ~3x faster than LANCZOS (more with Pillow-SIMD), no numpy round-trip
+        # reducing_gap: cheap integer box reduce first, so the bicubic pass
+        # runs on an image at most 2x the target (what thumbnail() does)
+        return pil_image.resize((new_w, new_h), Image.Resampling.BICUBIC, reducing_gap=2.0)
     
-    def convert_to_base64(self, pil_image: Image.Image, format: str = 'PNG') -> str:
+    def convert_to_base64(self, pil_image: Image.Image, format: str = 'PNG', quality: Optional[int] = None) -> str:
+        """
+        Encode image as base64
+        
+        Args:
+            pil_image: Image to encode
+            format: 'PNG' (lossless, fast zlib level) or 'JPEG' (SIMD libjpeg-turbo,
+                    much faster to encode when lossy output is acceptable)
+            quality: JPEG quality (default: ImageConfig.DEFAULT_QUALITY)
+        """
+        fmt = format.upper()
+        if fmt in ('JPEG', 'JPG'):
+            if pil_image.mode not in ('RGB', 'L'):
+                pil_image = pil_image.convert('RGB')
+            save_kwargs = {
+                'format': 'JPEG',
+                'quality': quality if quality is not None else ImageConfig.DEFAULT_QUALITY,
+                'optimize': False,
+                'progressive': False
+            }
+        elif fmt == 'PNG':
+            # Level 1 DEFLATE: most of the size win at a fraction of the default cost
+            save_kwargs = {'format': 'PNG', 'compress_level': 1}
+        else:
+            save_kwargs = {'format': format}
+        
         img_byte_arr = io.BytesIO()
-        pil_image.save(img_byte_arr, format=format)
-        img_byte_arr.seek(0)
-        return base64.b64encode(img_byte_arr.read()).decode('utf-8')
\ No newline at end of file
+        pil_image.save(img_byte_arr, **save_kwargs)
+        # getbuffer(): encode from the BytesIO memory directly, no extra copy
+        return base64.b64encode(img_byte_arr.getbuffer()).decode('ascii')
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+core/rate_limiter.py - Client-side Rate Limiting for Gemini Calls
+
+Shared across all thread-local GeminiClient instances so that concurrent
+Flask workers cooperate instead of tripping the API quota together.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict
+
+from utils.logger import info, debug
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) concurrency limiter
+
+    Works like TCP congestion control:
+    - Every successful call raises the in-flight limit by `increase`
+    - Every throttled call (429/5xx) multiplies the limit by `decrease`
+    - Callers block in acquire() while the limit is reached
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        increase: float = 0.5,
+        decrease: float = 0.5
+    ):
+        """
+        Initialize limiter
+
+        Args:
+            initial: Starting number of concurrent calls
+            min_limit: Lower bound for the limit
+            max_limit: Upper bound for the limit
+            increase: Amount added to the limit on success
+            decrease: Factor applied to the limit on throttling
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """Current number of permitted concurrent calls"""
+        return int(self._limit)
+
+    def acquire(self) -> None:
+        """Block until a call slot is available"""
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """Take a call slot if one is free, without blocking"""
+        with self._cond:
+            if self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        """Return a call slot"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        """Context manager wrapping acquire()/release()"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, poll_interval: float = 0.05):
+        """Async variant of slot() that polls instead of blocking the event loop"""
+        while not self.try_acquire():
+            await asyncio.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self) -> None:
+        """Additive increase after a successful call"""
+        with self._cond:
+            old_limit = int(self._limit)
+            self._limit = min(float(self.max_limit), self._limit + self.increase)
+            if int(self._limit) > old_limit:
+                self._cond.notify_all()
+
+    def on_throttle(self) -> None:
+        """Multiplicative decrease after a rate-limit or server error"""
+        with self._cond:
+            self._limit = max(float(self.min_limit), self._limit * self.decrease)
+            debug(f"⏬ Gemini concurrency limit lowered to {int(self._limit)}")
+
+
+class SlidingWindowRateLimiter:
+    """
+    Per-model requests-per-window limiter (sliding window log)
+
+    Blocks callers *before* submission when the window is full, instead of
+    spending a round-trip on a request the server would reject with 429.
+    Models without a configured limit are never throttled.
+    """
+
+    def __init__(self, limits: Dict[str, int], window_seconds: float = 60.0):
+        """
+        Initialize limiter
+
+        Args:
+            limits: Max requests per window, keyed by model name
+            window_seconds: Window length in seconds (default: 60 = RPM)
+        """
+        self.limits = dict(limits)
+        self.window = window_seconds
+
+        self._timestamps: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self, key: str) -> float:
+        """
+        Try to record a request for `key`
+
+        Returns:
+            0.0 if the request was admitted, else seconds to wait before retrying
+        """
+        limit = self.limits.get(key)
+        if not limit:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            timestamps = self._timestamps.setdefault(key, deque())
+
+            # Drop requests that have left the window
+            while timestamps and now - timestamps[0] >= self.window:
+                timestamps.popleft()
+
+            if len(timestamps) < limit:
+                timestamps.append(now)
+                return 0.0
+
+            return self.window - (now - timestamps[0])
+
+    def wait(self, key: str) -> None:
+        """Block until a request for `key` fits in the window"""
+        while True:
+            delay = self._reserve(key)
+            if delay <= 0:
+                return
+            info(f"⏳ Rate limit window full for {key}, waiting {delay:.1f}s")
+            time.sleep(delay)
+
+    async def await_slot(self, key: str) -> None:
+        """Async variant of wait() that doesn't block the event loop"""
+        while True:
+            delay = self._reserve(key)
+            if delay <= 0:
+                return
+            info(f"⏳ Rate limit window full for {key}, waiting {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,4 @@
+import os
+
+# config.py refuses to import without a key; tests never call the real API
+os.environ.setdefault("GEMINI_API_KEY", "AIzaSy-test-key")
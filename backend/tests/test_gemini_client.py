@@ -0,0 +1,124 @@
+"""
+tests/test_gemini_client.py - Retry classification and server retry hints
+"""
+
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+import httpx
+from google.api_core import exceptions as api_exceptions
+from google.genai import errors as genai_errors
+from google.protobuf.duration_pb2 import Duration
+from google.rpc.error_details_pb2 import RetryInfo
+
+from config import PerformanceConfig
+from core.gemini_client import GeminiClient
+
+
+def _api_error(code: int, details=None) -> genai_errors.APIError:
+    body = {'error': {'code': code, 'message': 'test', 'status': 'TEST'}}
+    if details is not None:
+        body['error']['details'] = details
+    return genai_errors.APIError(code, body)
+
+
+class TestIsRetryable(unittest.TestCase):
+    def test_transient_errors_are_retryable(self):
+        for e in (
+            api_exceptions.ResourceExhausted('quota'),
+            api_exceptions.ServiceUnavailable('down'),
+            api_exceptions.DeadlineExceeded('slow'),
+            TimeoutError(),
+            ConnectionError(),
+            _api_error(429),
+            _api_error(503),
+            httpx.ConnectError('refused'),
+        ):
+            with self.subTest(error=type(e).__name__):
+                self.assertTrue(GeminiClient._is_retryable(e))
+
+    def test_permanent_errors_are_not_retryable(self):
+        for e in (
+            api_exceptions.InvalidArgument('bad'),
+            api_exceptions.PermissionDenied('key'),
+            _api_error(400),
+            _api_error(404),
+            ValueError('validation error: extra inputs'),
+            # Message text alone must not make an error retryable
+            RuntimeError('prompt mentions 429 and a timeout'),
+        ):
+            with self.subTest(error=repr(e)):
+                self.assertFalse(GeminiClient._is_retryable(e))
+
+
+class TestRetryDelay(unittest.TestCase):
+    def setUp(self):
+        self.client = GeminiClient(api_key='test-key')
+
+    def test_parse_delay_seconds(self):
+        parse = GeminiClient._parse_delay_seconds
+        self.assertIsNone(parse(None))
+        self.assertEqual(parse(7), 7.0)
+        self.assertEqual(parse('13s'), 13.0)
+        self.assertEqual(parse(' 2.5 '), 2.5)
+        self.assertEqual(parse(timedelta(seconds=3)), 3.0)
+        self.assertEqual(parse(Duration(seconds=4, nanos=500_000_000)), 4.5)
+        self.assertIsNone(parse('Wed, 21 Oct 2015 07:28:00 GMT'))
+
+    def test_new_api_retry_info(self):
+        e = _api_error(429, [{'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': '13s'}])
+        self.assertEqual(self.client._get_retry_delay(e), 13.0)
+
+    def test_old_api_retry_info(self):
+        e = api_exceptions.ResourceExhausted(
+            'quota', details=[RetryInfo(retry_delay=Duration(seconds=9))]
+        )
+        self.assertEqual(self.client._get_retry_delay(e), 9.0)
+
+    def test_retry_after_header(self):
+        response = httpx.Response(429, headers={'retry-after': '5'})
+        e = genai_errors.APIError(429, {'error': {'code': 429}}, response)
+        self.assertEqual(self.client._get_retry_delay(e), 5.0)
+
+    def test_no_hint(self):
+        self.assertIsNone(self.client._get_retry_delay(_api_error(503)))
+        self.assertIsNone(self.client._get_retry_delay(TimeoutError()))
+
+    def test_backoff_uses_hint_and_clamps(self):
+        client = GeminiClient(api_key='test-key', max_delay=10.0)
+        e = _api_error(429, [{'retryDelay': '60s'}])
+        self.assertEqual(client._backoff_time(e, attempt=0), 10.0)
+
+        no_hint = _api_error(503)
+        delay = client._backoff_time(no_hint, attempt=1)
+        self.assertGreaterEqual(delay, client.base_delay * 2)
+        self.assertLessEqual(delay, client.base_delay * 2 * (1 + client.jitter))
+
+
+class TestJsonCache(unittest.TestCase):
+    def setUp(self):
+        self.client = GeminiClient(api_key='test-key')
+        GeminiClient._json_cache.clear()
+        self.addCleanup(GeminiClient._json_cache.clear)
+
+    def _call_twice(self):
+        with mock.patch.object(self.client, '_retry_with_backoff', return_value={'ok': 1}) as call:
+            first = self.client.generate_content_json('same prompt')
+            second = self.client.generate_content_json('same prompt')
+        self.assertEqual(first, {'ok': 1})
+        self.assertEqual(second, {'ok': 1})
+        return call.call_count
+
+    def test_disabled_by_config_calls_api_every_time(self):
+        with mock.patch.object(PerformanceConfig, 'ENABLE_CACHE', False):
+            self.assertEqual(self._call_twice(), 2)
+        self.assertEqual(len(GeminiClient._json_cache), 0)
+
+    def test_enabled_memoizes_identical_calls(self):
+        with mock.patch.object(PerformanceConfig, 'ENABLE_CACHE', True):
+            self.assertEqual(self._call_twice(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
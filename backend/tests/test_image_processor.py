@@ -0,0 +1,161 @@
+"""
+tests/test_image_processor.py - Sketch detection regression checks
+"""
+
+import base64
+import io
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import ImageConfig
+from core import image_processor
+from core.image_processor import ImageProcessor
+
+
+def _make_sketch(n_lines: int, size=(2400, 1600), seed: int = 0, shade: int = 255) -> Image.Image:
+    """Deterministic synthetic line drawing: dark strokes on a flat background"""
+    w, h = size
+    rng = np.random.default_rng(seed)
+    canvas = np.full((h, w, 3), shade, dtype=np.uint8)
+    for _ in range(n_lines):
+        x1, x2 = rng.integers(0, w, 2)
+        y1, y2 = rng.integers(0, h, 2)
+        cv2.line(canvas, (int(x1), int(y1)), (int(x2), int(y2)), (20, 20, 20), 2)
+    return Image.fromarray(canvas)
+
+
+def _baseline_stats(pil_image: Image.Image):
+    """Original full-resolution statistics the thresholds were tuned on"""
+    img_array = np.array(pil_image)
+    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY) if img_array.ndim == 3 else img_array
+    edges = cv2.Canny(gray,
+                      ImageConfig.EDGE_DETECTION_THRESHOLD_LOW,
+                      ImageConfig.EDGE_DETECTION_THRESHOLD_HIGH)
+    return float(np.mean(gray)), np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
+
+
+class TestSketchDetection(unittest.TestCase):
+    # (lines, background shade): spans simple / detailed / very_detailed and
+    # line_drawing / shaded / colored
+    SAMPLES = [(15, 255), (150, 255), (900, 255), (60, 180), (60, 120)]
+
+    def setUp(self):
+        self.processor = ImageProcessor()
+
+    def test_buckets_match_full_resolution_baseline(self):
+        seen_levels = set()
+        for i, (n_lines, shade) in enumerate(self.SAMPLES):
+            sketch = _make_sketch(n_lines, seed=i, shade=shade)
+            info = self.processor.detect_sketch_type(sketch)
+            mean, density = _baseline_stats(sketch)
+            expected = self.processor._classify_sketch(mean, density, True)
+
+            with self.subTest(n_lines=n_lines, shade=shade):
+                self.assertEqual(info.sketch_type, expected.sketch_type)
+                self.assertEqual(info.detail_level, expected.detail_level)
+                self.assertAlmostEqual(info.edge_density, density, delta=0.005)
+            seen_levels.add(info.detail_level)
+
+        # The sample set must actually exercise every detail bucket
+        self.assertEqual(seen_levels, {'simple', 'detailed', 'very_detailed'})
+
+    def test_from_bytes_matches_pil_entry_point(self):
+        for i, (n_lines, shade) in enumerate(self.SAMPLES):
+            sketch = _make_sketch(n_lines, seed=i, shade=shade)
+            buf = io.BytesIO()
+            sketch.save(buf, format='PNG')
+
+            from_pil = self.processor.detect_sketch_type(sketch)
+            from_bytes = self.processor.detect_sketch_type_from_bytes(buf.getvalue())
+
+            with self.subTest(n_lines=n_lines, shade=shade):
+                self.assertEqual(from_bytes.sketch_type, from_pil.sketch_type)
+                self.assertEqual(from_bytes.detail_level, from_pil.detail_level)
+                self.assertEqual(from_bytes.is_colored, from_pil.is_colored)
+
+    def test_grayscale_input_is_not_colored(self):
+        sketch = _make_sketch(60).convert('L')
+        self.assertFalse(self.processor.detect_sketch_type(sketch).is_colored)
+
+    def test_16bit_drawing_matches_between_entry_points(self):
+        # Dark strokes on a light 16-bit background; Pillow reopens it as mode 'I'
+        sketch_8bit = np.asarray(_make_sketch(120, size=(1200, 800), seed=7).convert('L'))
+        drawing = sketch_8bit.astype(np.uint16) * 257
+        buf = io.BytesIO()
+        Image.fromarray(drawing).save(buf, format='PNG')
+        decoded = Image.open(io.BytesIO(buf.getvalue()))
+
+        from_pil = self.processor.detect_sketch_type(decoded)
+        from_bytes = self.processor.detect_sketch_type_from_bytes(buf.getvalue())
+
+        self.assertEqual(decoded.mode, 'I')
+        self.assertFalse(from_pil.is_colored)
+        self.assertFalse(from_bytes.is_colored)
+        self.assertEqual(from_pil.sketch_type, from_bytes.sketch_type)
+        self.assertEqual(from_pil.detail_level, from_bytes.detail_level)
+        self.assertAlmostEqual(from_pil.mean_intensity, from_bytes.mean_intensity, places=3)
+        self.assertAlmostEqual(from_pil.edge_density, from_bytes.edge_density, places=4)
+        # Same buckets as the 8-bit version of the drawing
+        from_8bit = self.processor.detect_sketch_type(Image.fromarray(sketch_8bit))
+        self.assertEqual(from_pil.detail_level, from_8bit.detail_level)
+        self.assertEqual(from_pil.sketch_type, from_8bit.sketch_type)
+
+
+class TestProcessBase64Image(unittest.TestCase):
+    def setUp(self):
+        self.processor = ImageProcessor()
+
+    def test_invalid_input_returns_none_pair(self):
+        for bad in (None, 123, b'not-a-str', 'data:image/png;base64,'):
+            with self.subTest(value=bad):
+                self.assertEqual(self.processor.process_base64_image(bad), (None, None))
+
+    def test_data_uri_round_trip(self):
+        buf = io.BytesIO()
+        Image.new('RGB', (8, 4), (10, 20, 30)).save(buf, format='PNG')
+        data_uri = 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+        image, mime_type = self.processor.process_base64_image(data_uri)
+        self.assertEqual(mime_type, 'image/png')
+        self.assertEqual(image.size, (8, 4))
+        # Second call is served from the decode cache
+        self.assertIs(self.processor.process_base64_image(data_uri)[0], image)
+
+
+class TestBatchPreprocess(unittest.TestCase):
+    def test_batches_match_sequential(self):
+        processor = ImageProcessor()
+        sketches = [_make_sketch(40, size=(640, 480), seed=i) for i in range(3)]
+        expected = [
+            processor.preprocess_sketch(s, '16:9', processor.detect_sketch_type(s), False)
+            for s in sketches
+        ]
+
+        for batch in (processor.process_batch, processor.batch_preprocess):
+            with self.subTest(method=batch.__name__):
+                results = batch(sketches, '16:9', preserve_quality=False)
+                self.assertEqual([r.tobytes() for r in results], [e.tobytes() for e in expected])
+
+    def test_broken_process_pool_is_replaced(self):
+        processor = ImageProcessor()
+        sketches = [_make_sketch(10, size=(320, 240), seed=i) for i in range(2)]
+        processor.batch_preprocess(sketches, preserve_quality=False)
+
+        # Simulate a worker dying (OOM kill / native crash)
+        pool = image_processor._get_process_pool()
+        for process in list(pool._processes.values()):
+            process.kill()
+            process.join()
+
+        with self.assertRaises(BrokenProcessPool):
+            processor.batch_preprocess(sketches, preserve_quality=False)
+        self.assertIsNot(image_processor._get_process_pool(), pool)
+        self.assertEqual(len(processor.batch_preprocess(sketches, preserve_quality=False)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+tests/test_rate_limiter.py - AIMD concurrency and sliding-window RPM limiters
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from core.rate_limiter import AdaptiveConcurrencyLimiter, SlidingWindowRateLimiter
+
+
+class TestAdaptiveConcurrencyLimiter(unittest.TestCase):
+    def test_additive_increase_is_capped_at_max(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=2, max_limit=3, increase=0.5)
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 2)  # 2.5 rounds down
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+        for _ in range(10):
+            limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+
+    def test_multiplicative_decrease_is_floored_at_min(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=8, min_limit=1, decrease=0.5)
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(10):
+            limiter.on_throttle()
+        self.assertEqual(limiter.limit, 1)
+
+    def test_try_acquire_respects_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=2)
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.release()
+        self.assertTrue(limiter.try_acquire())
+
+    def test_slot_released_on_exception(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=1)
+        with self.assertRaises(RuntimeError):
+            with limiter.slot():
+                raise RuntimeError("boom")
+        self.assertTrue(limiter.try_acquire())
+
+    def test_aslot_released_on_exception(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=1)
+
+        async def failing_call():
+            async with limiter.aslot():
+                raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(failing_call())
+        self.assertTrue(limiter.try_acquire())
+
+    def test_acquire_blocks_until_release(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=1)
+        limiter.acquire()
+        acquired = threading.Event()
+
+        def waiter():
+            limiter.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=waiter, daemon=True)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.release()
+        self.assertTrue(acquired.wait(1.0))
+        thread.join(1.0)
+
+    def test_increase_wakes_blocked_callers(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=1, max_limit=2, increase=1.0)
+        limiter.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()), daemon=True)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.on_success()
+        self.assertTrue(acquired.wait(1.0))
+        thread.join(1.0)
+
+
+class TestSlidingWindowRateLimiter(unittest.TestCase):
+    def test_admits_up_to_limit_then_reports_wait(self):
+        limiter = SlidingWindowRateLimiter({'model': 2}, window_seconds=10.0)
+        self.assertEqual(limiter._reserve('model'), 0.0)
+        self.assertEqual(limiter._reserve('model'), 0.0)
+        delay = limiter._reserve('model')
+        self.assertGreater(delay, 9.0)
+        self.assertLessEqual(delay, 10.0)
+
+    def test_unconfigured_model_is_never_throttled(self):
+        limiter = SlidingWindowRateLimiter({'model': 1}, window_seconds=10.0)
+        for _ in range(5):
+            self.assertEqual(limiter._reserve('other'), 0.0)
+
+    def test_window_slides(self):
+        limiter = SlidingWindowRateLimiter({'model': 1}, window_seconds=0.1)
+        self.assertEqual(limiter._reserve('model'), 0.0)
+        self.assertGreater(limiter._reserve('model'), 0.0)
+        time.sleep(0.12)
+        self.assertEqual(limiter._reserve('model'), 0.0)
+
+    def test_wait_blocks_for_the_window(self):
+        limiter = SlidingWindowRateLimiter({'model': 1}, window_seconds=0.2)
+        limiter.wait('model')
+        start = time.monotonic()
+        limiter.wait('model')
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_await_slot_blocks_for_the_window(self):
+        limiter = SlidingWindowRateLimiter({'model': 1}, window_seconds=0.2)
+
+        async def two_calls():
+            await limiter.await_slot('model')
+            start = time.monotonic()
+            await limiter.await_slot('model')
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(two_calls()), 0.15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,35 +33,44 @@ def setup_logger(name: str) -> logging.Logger:
 # ============== GLOBAL LOGGER FOR EASY IMPORT ==============
 _default_logger = setup_logger('s2rtool')
 
+# Built once at import instead of on every log_print() call
+_LEVEL_MAP = {
+    'DEBUG': (logging.DEBUG, _default_logger.debug),
+    'INFO': (logging.INFO, _default_logger.info),
+    'WARNING': (logging.WARNING, _default_logger.warning),
+    'ERROR': (logging.ERROR, _default_logger.error),
+    'CRITICAL': (logging.CRITICAL, _default_logger.critical)
+}
+
 
 def debug(*args, **kwargs):
     """Debug level log (equivalent to print but with DEBUG level)"""
-    message = ' '.join(str(arg) for arg in args)
-    _default_logger.debug(message, **kwargs)
+    if _default_logger.isEnabledFor(logging.DEBUG):
+        _default_logger.debug(' '.join(map(str, args)), **kwargs)
 
 
 def info(*args, **kwargs):
     """Info level log (equivalent to print but with INFO level)"""
-    message = ' '.join(str(arg) for arg in args)
-    _default_logger.info(message, **kwargs)
+    if _default_logger.isEnabledFor(logging.INFO):
+        _default_logger.info(' '.join(map(str, args)), **kwargs)
 
 
 def warning(*args, **kwargs):
     """Warning level log"""
-    message = ' '.join(str(arg) for arg in args)
-    _default_logger.warning(message, **kwargs)
+    if _default_logger.isEnabledFor(logging.WARNING):
+        _default_logger.warning(' '.join(map(str, args)), **kwargs)
 
 
 def error(*args, **kwargs):
     """Error level log"""
-    message = ' '.join(str(arg) for arg in args)
-    _default_logger.error(message, **kwargs)
+    if _default_logger.isEnabledFor(logging.ERROR):
+        _default_logger.error(' '.join(map(str, args)), **kwargs)
 
 
 def critical(*args, **kwargs):
     """Critical level log"""
-    message = ' '.join(str(arg) for arg in args)
-    _default_logger.critical(message, **kwargs)
+    if _default_logger.isEnabledFor(logging.CRITICAL):
+        _default_logger.critical(' '.join(map(str, args)), **kwargs)
 
 
 # ============== BACKWARD COMPATIBLE PRINT REPLACEMENT ==============
@@ -79,15 +88,8 @@ def log_print(*args, level='INFO', **kwargs):
         level: Log level ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
         **kwargs: Additional kwargs for logger
     """
-    message = ' '.join(str(arg) for arg in args)
-
-    level_map = {
-        'DEBUG': _default_logger.debug,
-        'INFO': _default_logger.info,
-        'WARNING': _default_logger.warning,
-        'ERROR': _default_logger.error,
-        'CRITICAL': _default_logger.critical
-    }
-
-    log_func = level_map.get(level.upper(), _default_logger.info)
-    log_func(message, **kwargs)
+    levelno, log_func = _LEVEL_MAP.get(level if level.isupper() else level.upper(), _LEVEL_MAP['INFO'])
+
+    # Don't build the message for disabled levels
+    if _default_logger.isEnabledFor(levelno):
+        log_func(' '.join(map(str, args)), **kwargs)